@@ -11,11 +11,17 @@ from qr_to_pos import Camera, QRCodeProcessor
 class InteractiveCLI:
     """Interactive command line interface for camera and QR code processing."""
     
-    def __init__(self):
+    def __init__(self, show_raw: bool = False):
+        self.show_raw = show_raw  # Show the raw frame next to the annotated one (debugging)
         self.camera: Camera | None = None
         self.processor: QRCodeProcessor | None = None
         self.last_detection = None
         self.latest_detections: list = []  # Store latest detections for visualization
+        self._canvas: np.ndarray | None = None  # Display canvas, allocated on first frame
+        # Annotations rendered once per detection list and reused across frames
+        self._overlay_source: list | None = None
+        self._overlay: np.ndarray | None = None
+        self._overlay_mask: np.ndarray | None = None
         
         # Setup signal handler for graceful shutdown
         signal.signal(signal.SIGINT, self._signal_handler)
@@ -113,71 +119,118 @@ class InteractiveCLI:
             raise
     
     def _visualization_loop(self):
-        """Visualization loop showing raw image on left and annotated image on right."""
+        """Visualization loop showing the annotated image (and the raw image on its left if show_raw)."""
         window_name = 'QR Detection'
-        cv2.namedWindow(window_name, cv2.WINDOW_AUTOSIZE)
+        try:
+            # OpenGL window without vsync so imshow never blocks on the display
+            cv2.namedWindow(window_name, cv2.WINDOW_OPENGL)
+            cv2.setWindowProperty(window_name, cv2.WND_PROP_VSYNC, 0)
+            # OpenGL windows take a UMat directly, uploading it as a texture via OpenCL
+            use_umat = cv2.ocl.haveOpenCL()
+        except cv2.error:
+            # OpenCV built without OpenGL support
+            cv2.namedWindow(window_name, cv2.WINDOW_AUTOSIZE)
+            use_umat = False
         
+        last_shown_index = -1
+        poll_tick = 0
         try:
             while self.camera and self.camera._running and self.processor and self.processor._running:
                 frame = self.camera.get_latest_frame()
-                if frame is None:
-                    time.sleep(0.033)
-                    continue
-                
-                # Get raw image
-                raw_image = frame.data.copy()
-                
-                # Create annotated image (copy of raw)
-                annotated_image = raw_image.copy()
-                
-                # Draw boxes on annotated image
-                for qr in self.latest_detections:
-                    if qr.bbox:
-                        x1, y1, x2, y2 = qr.bbox
-                        # Draw rectangle
-                        cv2.rectangle(annotated_image, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                        
-                        # Draw label with data and confidence
-                        label = qr.data[:20] + '...' if len(qr.data) > 20 else qr.data
-                        if qr.confidence is not None:
-                            label = f'{label} ({qr.confidence:.2f})'
-                        
-                        label_size, _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.7, 2)
-                        label_y = max(y1, label_size[1] + 10)
-                        cv2.rectangle(
-                            annotated_image,
-                            (x1, label_y - label_size[1] - 10),
-                            (x1 + label_size[0], label_y),
-                            (0, 255, 0),
-                            cv2.FILLED
-                        )
-                        cv2.putText(
-                            annotated_image,
-                            label,
-                            (x1, label_y - 5),
-                            cv2.FONT_HERSHEY_SIMPLEX,
-                            0.7,
-                            (0, 0, 0),
-                            2
-                        )
-                
-                # Combine images side by side
-                combined_image = np.hstack((raw_image, annotated_image))
-                
-                # Display the combined image
-                cv2.imshow(window_name, combined_image)
+                if frame is not None and frame.index != last_shown_index:
+                    canvas = self._render(frame)
+                    cv2.imshow(window_name, cv2.UMat(canvas) if use_umat else canvas)
+                    last_shown_index = frame.index
+                else:
+                    time.sleep(0.001)  # No new frame yet, don't spin
                 
-                # Check for window close or 'q' key
-                key = cv2.waitKey(1) & 0xFF
-                if key == ord('q') or cv2.getWindowProperty(window_name, cv2.WND_PROP_VISIBLE) < 1:
+                # Check for 'q' every pass; the window-visible query is a round-trip
+                # into the GUI backend, so only do it every 10th pass
+                poll_tick += 1
+                key = cv2.pollKey() & 0xFF
+                if key == ord('q'):
+                    break
+                if poll_tick % 10 == 0 and cv2.getWindowProperty(window_name, cv2.WND_PROP_VISIBLE) < 1:
                     break
-                
-                time.sleep(0.033)  # ~30 FPS display rate
         finally:
             cv2.destroyWindow(window_name)
             # Clear detections when visualization stops
             self.latest_detections = []
     
+    def _render(self, frame) -> np.ndarray:
+        """Render the annotated frame, with the raw frame on its left if show_raw."""
+        # Reuse the canvas instead of allocating per frame
+        height, width = frame.data.shape[:2]
+        canvas_width = 2 * width if self.show_raw else width
+        if self._canvas is None or self._canvas.shape[:2] != (height, canvas_width):
+            self._canvas = np.empty((height, canvas_width, 3), dtype=np.uint8)
+        
+        # Raw image on the left (if shown), annotated image on the right
+        if self.show_raw:
+            np.copyto(self._canvas[:, :width], frame.data)
+        annotated_image = self._canvas[:, canvas_width - width:]
+        np.copyto(annotated_image, frame.data)
+        
+        # Detections update slower than the display, so only re-render the overlay
+        # when the processor publishes a new list. Read it once: the callback thread
+        # may swap it mid-render
+        detections = self.latest_detections
+        if detections:
+            if (
+                self._overlay_source is not detections
+                or self._overlay is None
+                or self._overlay.shape != annotated_image.shape
+            ):
+                self._render_overlay(detections, annotated_image.shape)
+            cv2.copyTo(self._overlay, self._overlay_mask, annotated_image)
+        
+        return self._canvas
+    
+    def _render_overlay(self, detections: list, shape: tuple[int, ...]) -> None:
+        """Draw detections into a cached overlay and its copy mask."""
+        overlay = np.zeros(shape, dtype=np.uint8)
+        mask = np.zeros(shape[:2], dtype=np.uint8)
+        
+        for qr in detections:
+            if qr.bbox:
+                x1, y1, x2, y2 = qr.bbox
+                # Draw rectangle
+                cv2.rectangle(overlay, (x1, y1), (x2, y2), (0, 255, 0), 2)
+                cv2.rectangle(mask, (x1, y1), (x2, y2), 255, 2)
+                
+                # Draw label with data and confidence
+                label = qr.display_label
+                label_size, _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.7, 2)
+                label_y = max(y1, label_size[1] + 10)
+                cv2.rectangle(
+                    overlay,
+                    (x1, label_y - label_size[1] - 10),
+                    (x1 + label_size[0], label_y),
+                    (0, 255, 0),
+                    cv2.FILLED
+                )
+                # The label text sits inside this box, so the box covers it in the mask
+                cv2.rectangle(
+                    mask,
+                    (x1, label_y - label_size[1] - 10),
+                    (x1 + label_size[0], label_y),
+                    255,
+                    cv2.FILLED
+                )
+                cv2.putText(
+                    overlay,
+                    label,
+                    (x1, label_y - 5),
+                    cv2.FONT_HERSHEY_SIMPLEX,
+                    0.7,
+                    (0, 0, 0),
+                    2
+                )
+        
+        self._overlay = overlay
+        self._overlay_mask = mask
+        self._overlay_source = detections
+    
     def start_visualization(self):
         """Start camera-only visualization."""
         # Automatically start camera if not running
@@ -289,7 +342,17 @@ class InteractiveCLI:
 
 
 def main():
-    cli = InteractiveCLI()
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Interactive QR code detection CLI")
+    parser.add_argument(
+        "--show-raw",
+        action="store_true",
+        help="Show the raw camera frame next to the annotated one",
+    )
+    args = parser.parse_args()
+    
+    cli = InteractiveCLI(show_raw=args.show_raw)
     cli.run()
 
 
@@ -1,12 +1,15 @@
 from .camera import Camera, Frame
-from .processor import ProcessingResult, QRCode, QRCodeProcessor
+from .detector import BatchQRDetector
+from .processor import ProcessingResult, QRCode, QRCodeProcessor, QRTracker
 from .server import DetectionServer
 
 __all__ = [
+    "BatchQRDetector",
     "Camera",
     "DetectionServer",
     "Frame",
     "ProcessingResult",
     "QRCode",
     "QRCodeProcessor",
+    "QRTracker",
 ]
@@ -1,6 +1,7 @@
+import queue
 import threading
 import time
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Callable
 
 import cv2
@@ -13,6 +14,8 @@ class Frame:
     data: np.ndarray
     timestamp: float
     index: int
+    # RealSense frame backing ``data``; held so librealsense doesn't recycle the buffer
+    source: rs.frame | None = field(default=None, repr=False)
 
 
 class Camera:
@@ -47,8 +50,13 @@ class Camera:
         # Configure streams
         self.config.enable_stream(rs.stream.color, width, height, rs.format.bgr8, 30)
         
-        self._latest_frame: Frame | None = None
-        self._frame_lock = threading.Lock()
+        # Hold at most one frameset so a slow consumer always gets the newest frame
+        # instead of a backlog; keep_frames detaches frames from the sensor pool.
+        self._frame_queue = rs.frame_queue(1, keep_frames=True)
+        
+        # Single-slot, latest-wins handoff between the capture thread and readers
+        self._slot: queue.Queue[Frame] = queue.Queue(maxsize=1)
+        self._new_frame_event = threading.Event()
         self._frame_index = 0
         self._capture_thread: threading.Thread | None = None
         self._running = False
@@ -64,7 +72,7 @@ class Camera:
         if self._running:
             return
         
-        self.pipeline.start(self.config)
+        self.pipeline.start(self.config, self._frame_queue)
         self._running = True
         self._capture_thread = threading.Thread(target=self._capture_loop, daemon=True)
         self._capture_thread.start()
@@ -82,8 +90,20 @@ class Camera:
     
     def get_latest_frame(self) -> Frame | None:
         """Get the most recent frame (thread-safe)."""
-        with self._frame_lock:
-            return self._latest_frame
+        # Peek without taking the queue's lock; indexing the deque is atomic
+        try:
+            return self._slot.queue[0]
+        except IndexError:
+            return None
+    
+    def wait_for_new_frame(self, timeout: float | None = None) -> bool:
+        """Block until a new frame is published; returns False on timeout.
+        
+        Meant for a single consumer: each call consumes the notification.
+        """
+        arrived = self._new_frame_event.wait(timeout)
+        self._new_frame_event.clear()
+        return arrived
     
     def on_frame(self, callback: Callable[[Frame], None]) -> None:
         """Register a callback to be called on each new frame."""
@@ -98,7 +118,7 @@ class Camera:
         while self._running:
             try:
                 # Wait for frames
-                frames = self.pipeline.wait_for_frames(timeout_ms=5000)
+                frames = self._frame_queue.wait_for_frame(timeout_ms=5000).as_frameset()
                 color_frame = frames.get_color_frame()
                 
                 if not color_frame:
@@ -112,20 +132,27 @@ class Camera:
                         time.sleep(frame_time - elapsed)
                     last_frame_time = time.time()
                 
-                # Convert to numpy array
-                color_image = np.asanyarray(color_frame.get_data())
+                # Zero-copy view over the RealSense buffer
+                color_image = np.frombuffer(color_frame.get_data(), dtype=np.uint8).reshape(
+                    (self.height, self.width, 3)
+                )
                 
                 # Create frame object
                 frame = Frame(
                     data=color_image,
                     timestamp=time.time(),
-                    index=self._frame_index
+                    index=self._frame_index,
+                    source=color_frame,
                 )
                 self._frame_index += 1
                 
-                # Update latest frame
-                with self._frame_lock:
-                    self._latest_frame = frame
+                # Replace the latest frame (only this thread writes the slot)
+                try:
+                    self._slot.get_nowait()
+                except queue.Empty:
+                    pass
+                self._slot.put_nowait(frame)
+                self._new_frame_event.set()
                 
                 # Call callbacks
                 with self._callback_lock:
@@ -149,20 +176,37 @@ class Camera:
         
         self._window_name = window_name
         self._visualization_running = True
-        cv2.namedWindow(self._window_name, cv2.WINDOW_AUTOSIZE)
+        try:
+            # OpenGL window without vsync so imshow never blocks on the display
+            cv2.namedWindow(self._window_name, cv2.WINDOW_OPENGL)
+            cv2.setWindowProperty(self._window_name, cv2.WND_PROP_VSYNC, 0)
+            # OpenGL windows take a UMat directly, uploading it as a texture via OpenCL
+            use_umat = cv2.ocl.haveOpenCL()
+        except cv2.error:
+            # OpenCV built without OpenGL support
+            cv2.namedWindow(self._window_name, cv2.WINDOW_AUTOSIZE)
+            use_umat = False
         
+        last_shown_index = -1
+        poll_tick = 0
         try:
             while self._visualization_running:
                 frame = self.get_latest_frame()
-                if frame is not None:
-                    cv2.imshow(self._window_name, frame.data)
+                if frame is not None and frame.index != last_shown_index:
+                    cv2.imshow(self._window_name, cv2.UMat(frame.data) if use_umat else frame.data)
+                    last_shown_index = frame.index
+                else:
+                    time.sleep(0.001)  # No new frame yet, don't spin
                 
-                key = cv2.waitKey(1) & 0xFF
-                if key == ord('q') or cv2.getWindowProperty(self._window_name, cv2.WND_PROP_VISIBLE) < 1:
+                # Window-visible query is a backend round-trip; every 10th pass is plenty
+                poll_tick += 1
+                key = cv2.pollKey() & 0xFF
+                if key == ord('q') or (
+                    poll_tick % 10 == 0
+                    and cv2.getWindowProperty(self._window_name, cv2.WND_PROP_VISIBLE) < 1
+                ):
                     self._visualization_running = False
                     break
-                    
-                time.sleep(0.033)  # ~30 FPS display rate
         finally:
             cv2.destroyWindow(self._window_name)
             self._visualization_running = False
@@ -0,0 +1,143 @@
+import hashlib
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import torch
+from qrdet import QRDetector, _prepare_input, _yolo_v8_results_to_dict
+from ultralytics import YOLO
+
+
+class BatchQRDetector(QRDetector):
+    """QRDetector that can run several images through YOLO in one forward pass.
+
+    Runs on CUDA in half precision when a GPU is available, or as an INT8 TensorRT
+    engine with quantize=True.
+    """
+
+    def __init__(
+        self,
+        model_size: str = "s",
+        device: str | None = None,
+        half: bool | None = None,
+        quantize: bool = False,
+        calibration_data: str | None = None,
+        max_batch: int = 1,
+        engine_dir: str | None = None,
+        cudnn_benchmark: bool = False,
+        **kwargs,
+    ) -> None:
+        super().__init__(model_size=model_size, **kwargs)
+        if device is None:
+            device = "cuda:0" if torch.cuda.is_available() else "cpu"
+        self.device = device
+        # FP16 only pays off (and is only supported by ultralytics) on the GPU
+        self.half = device.startswith("cuda") if half is None else half
+        if cudnn_benchmark and device.startswith("cuda"):
+            # Only for fixed-size frames: cuDNN autotunes once per input shape, which
+            # happens at warmup, but would stall live requests on every new shape
+            torch.backends.cudnn.benchmark = True
+        if quantize:
+            self._load_int8_engine(calibration_data, max_batch, engine_dir)
+
+    def _load_int8_engine(
+        self, calibration_data: str | None, max_batch: int, engine_dir: str | None
+    ) -> None:
+        """Swap the PyTorch model for an INT8 TensorRT engine, exporting it on first use.
+
+        Engines are cached in engine_dir (default ~/.cache/qr_to_pos) under a name that
+        records the batch size, calibration data, TensorRT version and GPU they were built
+        for. Keeps the PyTorch model if there's no GPU or the engine fails to export or load.
+        """
+        if not self.device.startswith("cuda"):
+            print("INT8 quantization needs a CUDA device with TensorRT, using the PyTorch model")
+            return
+
+        if engine_dir is None:
+            cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+            engine_dir = str(Path(cache_home) / "qr_to_pos")
+        weights = Path(self.model.ckpt_path)
+        pytorch_model = self.model
+        engine = None
+        try:
+            import tensorrt
+
+            if calibration_data:
+                calibration = hashlib.sha256(Path(calibration_data).read_bytes()).hexdigest()[:12]
+            else:
+                calibration = "default"
+            # Engines are only valid for the TensorRT version and GPU architecture that built them
+            major, minor = torch.cuda.get_device_capability(self.device)
+            engine = Path(engine_dir) / (
+                f"{weights.stem}-int8-b{max_batch}-{calibration}"
+                f"-trt{tensorrt.__version__}-sm{major}{minor}.engine"
+            )
+            if not engine.exists():
+                # Calibrates on calibration_data (a dataset YAML), ultralytics' default otherwise;
+                # dynamic so batches of up to max_batch fit the engine
+                export_args = {"data": calibration_data} if calibration_data else {}
+                exported = self.model.export(
+                    format="engine",
+                    int8=True,
+                    dynamic=True,
+                    batch=max_batch,
+                    device=self.device,
+                    verbose=False,
+                    **export_args,
+                )
+                # Ultralytics writes next to the weights, inside qrdet's package directory
+                engine.parent.mkdir(parents=True, exist_ok=True)
+                shutil.move(exported, engine)
+            self.model = YOLO(str(engine), task="segment")
+            # YOLO only deserializes the engine on the first predict, so run one here
+            self.model.predict(
+                np.zeros((640, 640, 3), dtype=np.uint8), device=self.device, verbose=False
+            )
+        except Exception as e:
+            print(f"Error loading INT8 engine, using the PyTorch model: {e}")
+            self.model = pytorch_model
+            if engine is not None:
+                engine.unlink(missing_ok=True)
+
+    def warmup(self, height: int = 720, width: int = 1280, batch_size: int = 1) -> None:
+        """Run inference on blank frames so lazy setup (predictor, cuDNN autotuning)
+        happens now rather than on the first real frame.
+
+        Batched passes have their own input shape, so a batch of batch_size is warmed up too.
+        """
+        blank = np.zeros((height, width, 3), dtype=np.uint8)
+        self.detect(blank, is_bgr=True)
+        if batch_size > 1:
+            self.detect_batch([blank] * batch_size, is_bgr=True)
+
+    def detect(self, image: np.ndarray, is_bgr: bool = False, **kwargs) -> list[dict]:  # type: ignore
+        return self.detect_batch([image], is_bgr=is_bgr)[0]
+
+    def detect_batch(
+        self, images: list[np.ndarray], is_bgr: bool = False
+    ) -> list[list[dict]]:
+        """Detect QR codes in each image; returns one detection list per image, in order."""
+        if not images:
+            return []
+
+        # Images go in as uint8 HWC; ultralytics' predictor does the letterbox, CHW layout
+        # and float conversion itself, normalising after the upload to self.device. Passing
+        # a pre-built tensor instead would return boxes and masks in letterboxed coordinates.
+        prepared = [_prepare_input(source=image, is_bgr=is_bgr) for image in images]
+        results = self.model.predict(
+            source=prepared,
+            conf=self._conf_th,
+            iou=self._nms_iou,
+            half=self.half,
+            device=self.device,
+            max_det=100,
+            augment=False,
+            agnostic_nms=True,
+            classes=None,
+            verbose=False,
+        )
+        return [
+            _yolo_v8_results_to_dict(results=result, image=image)
+            for result, image in zip(results, prepared)
+        ]
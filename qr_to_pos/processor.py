@@ -1,12 +1,16 @@
 import threading
 import time
 from dataclasses import dataclass
+from functools import cached_property
 from typing import Callable
 
+import cv2
 import numpy as np
-from qrdet import QRDetector
+import torch
+from pyzbar.pyzbar import decode as pyzbar_decode
 
 from .camera import Camera, Frame
+from .detector import BatchQRDetector
 
 
 @dataclass
@@ -25,6 +29,83 @@ class QRCode:
     bbox: tuple[int, int, int, int] | None = None
     confidence: float | None = None
     decoded: str | None = None
+    
+    @cached_property
+    def display_label(self) -> str:
+        """Short on-screen label: truncated data plus confidence, formatted once."""
+        label = self.data[:20] + '...' if len(self.data) > 20 else self.data
+        if self.confidence is not None:
+            label = f'{label} ({self.confidence:.2f})'
+        return label
+
+
+def decode_region(
+    image: np.ndarray, bbox: tuple[int, int, int, int], pad: int
+) -> tuple[str, tuple[int, int, int, int]] | None:
+    """Decode a QR code with pyzbar inside a padded region of a BGR or grayscale image.
+    
+    Returns the decoded text and the code's bounding box in image coordinates,
+    or None if nothing could be decoded.
+    """
+    x1, y1, x2, y2 = bbox
+    h, w = image.shape[:2]
+    left, top = max(0, x1 - pad), max(0, y1 - pad)
+    crop = image[top : min(h, y2 + pad), left : min(w, x2 + pad)]
+    if crop.size == 0:
+        return None
+    if crop.ndim == 3:
+        crop = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+    
+    results = pyzbar_decode(crop)
+    if not results:
+        return None
+    
+    rect = results[0].rect
+    found_bbox = (
+        left + rect.left,
+        top + rect.top,
+        left + rect.left + rect.width,
+        top + rect.top + rect.height,
+    )
+    return results[0].data.decode("utf-8", errors="replace"), found_bbox
+
+
+class QRTracker:
+    """Follows previously detected QR codes by decoding padded crops around them."""
+    
+    def __init__(self, redetect_interval: int = 30, roi_padding: float = 0.3) -> None:
+        self.redetect_interval = redetect_interval
+        self.roi_padding = roi_padding
+        self._tracked: list[QRCode] = []
+        self._frames_since_detect = 0
+    
+    def track(self, image: np.ndarray) -> list[QRCode] | None:
+        """Re-locate the tracked QR codes, or return None when a full detection is needed."""
+        if not self._tracked or self._frames_since_detect >= self.redetect_interval:
+            return None
+        
+        tracked = []
+        for qr in self._tracked:
+            x1, y1, x2, y2 = qr.bbox  # type: ignore
+            pad = int(self.roi_padding * max(x2 - x1, y2 - y1))
+            found = decode_region(image, qr.bbox, pad)  # type: ignore
+            if found is None:
+                # Lost one of them, let the detector find everything again
+                return None
+            
+            decoded, bbox = found
+            tracked.append(
+                QRCode(data=qr.data, bbox=bbox, confidence=qr.confidence, decoded=decoded)
+            )
+        
+        self._tracked = tracked
+        self._frames_since_detect += 1
+        return tracked
+    
+    def reset(self, qr_codes: list[QRCode]) -> None:
+        """Start tracking the result of a full detection."""
+        self._tracked = [qr for qr in qr_codes if qr.bbox is not None]
+        self._frames_since_detect = 0
 
 
 class QRCodeProcessor:
@@ -35,15 +116,36 @@ class QRCodeProcessor:
         camera: Camera,
         min_interval: float = 0.1,
         model_size: str = 's',
+        num_threads: int | None = None,
+        static_threshold: float = 2.0,
+        redetect_interval: int = 30,
+        batch_size: int = 1,
+        batch_window: float = 0.03,
     ) -> None:
         self.camera = camera
         self.min_interval = min_interval
-        self.detector = QRDetector(model_size=model_size)
+        # Up to batch_size frames arriving within batch_window share one detector call
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        # Mean per-pixel luma change below which a frame reuses the last detections (0 disables)
+        self.static_threshold = static_threshold
+        if num_threads is not None:
+            # Keep torch's intra-op pool from starving the capture and display threads
+            torch.set_num_threads(num_threads)
+        # Camera frames are all the same size, so cuDNN autotuning at warmup covers them
+        self.detector = BatchQRDetector(model_size=model_size, cudnn_benchmark=True)
+        try:
+            self.detector.warmup(height=camera.height, width=camera.width, batch_size=batch_size)
+        except Exception as e:
+            print(f"Error warming up detector: {e}")
+        self._tracker = QRTracker(redetect_interval=redetect_interval)
         self._processing_thread: threading.Thread | None = None
         self._running = False
         self._callbacks: list[Callable[[ProcessingResult], None]] = []
         self._callback_lock = threading.Lock()
         self._last_processed_index = -1
+        self._prev_small: np.ndarray | None = None
+        self._last_result: list[QRCode] | None = None
     
     def on_result(self, callback: Callable[[ProcessingResult], None]) -> None:
         with self._callback_lock:
@@ -68,36 +170,85 @@ class QRCodeProcessor:
     def _process_loop(self) -> None:
         while self._running:
             try:
-                frame = self.camera.get_latest_frame()
+                frames = self._collect_frames()
                 
-                if frame is None or frame.index <= self._last_processed_index:
-                    time.sleep(self.min_interval)
+                if not frames:
                     continue
                 
-                # Process the frame
+                # Process the batch, reusing the last detections if the scene hasn't changed
                 start_time = time.time()
-                result = self.process_frame(frame)
+                changed = [frame for frame in frames if not self._is_static(frame)]
+                detected = dict(zip((f.index for f in changed), self.process_frames(changed)))
                 processing_time = time.time() - start_time
                 
-                self._last_processed_index = frame.index
-                
-                if result is not None and len(result) > 0:
-                    processing_result = ProcessingResult(
-                        result=result,
-                        frame_index=frame.index,
-                        frame_timestamp=frame.timestamp,
-                        processing_time=processing_time
-                    )
-                    self._emit_result(processing_result)
-                
-                # Rate limiting
-                time.sleep(self.min_interval)
+                for frame in frames:
+                    if frame.index in detected:
+                        self._last_result = detected[frame.index]
+                    result = self._last_result
+                    self._last_processed_index = frame.index
+                    
+                    if result is not None and len(result) > 0:
+                        processing_result = ProcessingResult(
+                            result=result,
+                            frame_index=frame.index,
+                            frame_timestamp=frame.timestamp,
+                            processing_time=processing_time
+                        )
+                        self._emit_result(processing_result)
                 
             except Exception as e:
                 if self._running:
                     print(f"Error in processing loop: {e}")
                     time.sleep(self.min_interval)
     
+    def _collect_frames(self) -> list[Frame]:
+        """Gather up to batch_size new frames, waiting at most batch_window after the first.
+        
+        Sleeps on the camera's new-frame notification rather than polling, waiting
+        at most min_interval for the first frame.
+        """
+        frames: list[Frame] = []
+        last_index = self._last_processed_index
+        deadline: float | None = None
+        
+        while self._running and len(frames) < self.batch_size:
+            frame = self.camera.get_latest_frame()
+            if frame is not None and frame.index > last_index:
+                frames.append(frame)
+                last_index = frame.index
+                if deadline is None:
+                    deadline = time.time() + self.batch_window
+                continue
+            
+            if deadline is None:
+                if not self.camera.wait_for_new_frame(timeout=self.min_interval):
+                    break
+            else:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self.camera.wait_for_new_frame(timeout=remaining)
+        
+        return frames
+    
+    def _is_static(self, frame: Frame) -> bool:
+        """Compare a small luma thumbnail against the last detected frame."""
+        if self.static_threshold <= 0:
+            return False
+        
+        small = cv2.cvtColor(
+            cv2.resize(frame.data, (80, 45), interpolation=cv2.INTER_AREA),
+            cv2.COLOR_BGR2GRAY,
+        )
+        if self._prev_small is not None:
+            sad = cv2.sumElems(cv2.absdiff(small, self._prev_small))[0]
+            if sad < self.static_threshold * small.size:
+                return True
+        
+        # Only re-anchor on frames that get detected, so slow drift still triggers
+        self._prev_small = small
+        return False
+    
     def _emit_result(self, result: ProcessingResult) -> None:
         with self._callback_lock:
             for callback in self._callbacks:
@@ -107,36 +258,68 @@ class QRCodeProcessor:
                     print(f"Error in result callback: {e}")
     
     def process_frame(self, frame: Frame) -> list[QRCode] | None:
+        return self.process_frames([frame])[0]
+    
+    def process_frames(self, frames: list[Frame]) -> list[list[QRCode] | None]:
+        """Process frames in order, running one batched detection for those that need it."""
         try:
-            detections = self.detector.detect(image=frame.data, is_bgr=True)
+            results: list[list[QRCode] | None] = []
+            pending: list[int] = []
             
-            if not detections:
-                return None
+            # Follow codes from earlier frames with pyzbar before running the detector
+            for frame in frames:
+                tracked = self._tracker.track(frame.data)
+                if tracked is None:
+                    pending.append(len(results))
+                results.append(tracked)
             
-            # Convert detections to QRCode objects
-            qr_codes = []
+            if not pending:
+                return results
             
-            for detection in detections:
-                x1, y1, x2, y2 = detection['bbox_xyxy']  # type: ignore
-                confidence = detection.get('confidence', 1.0)
-                data = detection.get('data', '')
-                
-                # Ensure coordinates are standard Python ints
-                x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-                
-                qr_code = QRCode(
-                    data=data,  # type: ignore
-                    bbox=(x1, y1, x2, y2),
-                    confidence=confidence  # type: ignore
-                )
-                qr_codes.append(qr_code)
+            batch_detections = self.detector.detect_batch(
+                [frames[i].data for i in pending], is_bgr=True
+            )
+            for i, detections in zip(pending, batch_detections):
+                results[i] = self._to_qr_codes(detections)
             
-            # Return all detected QR codes
-            return qr_codes if qr_codes else None
+            # The tracker re-decodes every code it follows and gives up on the first miss,
+            # so only hand it the last detection if pyzbar can read all of its boxes
+            last = results[pending[-1]] or []
+            image = frames[pending[-1]].data
+            for qr in last:
+                found = decode_region(image, qr.bbox, pad=10)  # type: ignore
+                if found is None:
+                    last = []
+                    break
+                qr.decoded = found[0]
+            self._tracker.reset(last)
+            return results
             
         except Exception as e:
             print(f"Error processing frame: {e}")
-            return None
+            return [None] * len(frames)
+    
+    def _to_qr_codes(self, detections: list[dict]) -> list[QRCode] | None:
+        # Convert detections to QRCode objects
+        qr_codes = []
+        
+        # Ensure coordinates are standard Python ints, casting all boxes in one pass
+        xyxy = np.array([d['bbox_xyxy'] for d in detections], dtype=np.float32).reshape(-1, 4)
+        bboxes = xyxy.astype(np.int32).tolist()
+        
+        for detection, bbox in zip(detections, bboxes):
+            confidence = detection.get('confidence', 1.0)
+            data = detection.get('data', '')
+            
+            qr_code = QRCode(
+                data=data,  # type: ignore
+                bbox=tuple(bbox),  # type: ignore
+                confidence=confidence  # type: ignore
+            )
+            qr_codes.append(qr_code)
+        
+        # Return all detected QR codes
+        return qr_codes if qr_codes else None
     
     def __enter__(self) -> "QRCodeProcessor":
         self.start()
@@ -1,17 +1,102 @@
 import asyncio
-import base64
-import json
+import inspect
+import os
 import signal
+import threading
 import time
-from dataclasses import asdict
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from urllib.parse import parse_qs, urlsplit
 
 import cv2
+import msgpack
 import numpy as np
-from pyzbar.pyzbar import decode as pyzbar_decode
-from qrdet import QRDetector
+import orjson
+import pybase64
+import torch
 from websockets.asyncio.server import serve
 
-from .processor import QRCode
+from .detector import BatchQRDetector
+from .processor import QRCode, QRTracker, decode_region
+
+try:
+    from turbojpeg import TJPF_BGR, TurboJPEG
+except ImportError:  # PyTurboJPEG is optional
+    TurboJPEG = None
+
+try:
+    import uvloop
+except ImportError:  # Not available on Windows
+    uvloop = None
+
+
+def _load_turbojpeg() -> "TurboJPEG | None":
+    if TurboJPEG is None:
+        return None
+    try:
+        return TurboJPEG()
+    except RuntimeError:
+        # Python bindings installed but libturbojpeg isn't
+        return None
+
+
+# Errors a misbehaving client can trigger on every frame, encoded once per response format
+_COMMON_ERRORS = (
+    "Invalid JSON",
+    "Missing 'image' field",
+    "Unsupported message type",
+    "Failed to decode image",
+)
+_ERROR_FRAMES = {
+    "json": {msg: orjson.dumps({"error": msg}) for msg in _COMMON_ERRORS},
+    "msgpack": {msg: msgpack.packb({"error": msg}, use_bin_type=True) for msg in _COMMON_ERRORS},
+}
+
+
+def _numpy_item(obj: object) -> object:
+    # msgpack fallback for numpy scalars, which orjson handles natively
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Cannot serialize {type(obj).__name__}")
+
+
+class FramePool:
+    """Recycles decoded image buffers by shape so requests don't allocate a new frame each time.
+
+    Buffers are acquired on decode threads and released on the event loop, so the
+    free lists and their count are guarded by a lock. Only buffers handed out by
+    acquire() are taken back; anything else passed to release() is left alone.
+    """
+
+    def __init__(self, max_buffers: int) -> None:
+        self.max_buffers = max_buffers
+        self._free: dict[tuple[int, ...], deque[np.ndarray]] = {}
+        self._count = 0
+        # Weak, so a buffer that is never released is simply freed and forgotten
+        self._leased: weakref.WeakValueDictionary[int, np.ndarray] = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+    def acquire(self, shape: tuple[int, ...]) -> np.ndarray:
+        with self._lock:
+            free = self._free.get(shape)
+            if free:
+                self._count -= 1
+                buf = free.pop()
+            else:
+                buf = np.empty(shape, dtype=np.uint8)
+            self._leased[id(buf)] = buf
+            return buf
+
+    def release(self, buf: np.ndarray) -> None:
+        with self._lock:
+            if self._leased.pop(id(buf), None) is not buf:
+                return
+            if self._count >= self.max_buffers:
+                return
+            self._free.setdefault(buf.shape, deque()).append(buf)
+            self._count += 1
 
 
 class DetectionServer:
@@ -23,87 +108,316 @@ class DetectionServer:
         port: int = 8765,
         model_size: str = "s",
         max_size: int = 16 * 1024 * 1024,
+        num_threads: int | None = None,
+        redetect_interval: int = 30,
+        decode_scale: int = 1,
+        batch_size: int = 1,
+        max_delay_ms: float = 5.0,
+        quantize: bool = False,
+        calibration_data: str | None = None,
+        engine_dir: str | None = None,
+        decode_conf_threshold: float = 0.3,
+        min_decode_size: int = 20,
+        max_inflight: int | None = None,
+        cpu_affinity: list[int] | None = None,
     ) -> None:
+        if decode_scale not in (1, 2):
+            raise ValueError("decode_scale must be 1 or 2")
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
         self.host = host
         self.port = port
         self.max_size = max_size
-        self.detector = QRDetector(model_size=model_size)
+        self.redetect_interval = redetect_interval
+        # Decode uploads at 1/decode_scale resolution; boxes are scaled back in responses
+        self.decode_scale = decode_scale
+        # Requests from all connections arriving within max_delay_ms share one forward pass
+        self.batch_size = batch_size
+        self.max_delay_ms = max_delay_ms
+        # Boxes below either threshold are reported without running pyzbar on them. The
+        # detector already drops boxes under its own conf_th (0.5 by default), so the
+        # confidence gate only takes effect if that is lowered below decode_conf_threshold
+        self.decode_conf_threshold = decode_conf_threshold
+        self.min_decode_size = min_decode_size
+        self._tj = _load_turbojpeg()
+        # Decoding into a recycled buffer needs PyTurboJPEG's dst argument (2.0+)
+        self._tj_dst = self._tj is not None and "dst" in inspect.signature(self._tj.decode).parameters
+        self._frame_pool = FramePool(max_buffers=2 * batch_size)
+        if cpu_affinity is not None:
+            # Pin before any worker thread exists so they all inherit the mask and
+            # stay off the other cores
+            try:
+                os.sched_setaffinity(0, set(cpu_affinity))
+            except (AttributeError, OSError) as e:
+                print(f"Error setting CPU affinity: {e}")
+            else:
+                if num_threads is None:
+                    num_threads = len(cpu_affinity)
+                try:
+                    torch.set_num_interop_threads(1)
+                except RuntimeError:
+                    # Inter-op pool already started by an earlier torch call
+                    pass
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
+        self.detector = BatchQRDetector(
+            model_size=model_size,
+            quantize=quantize,
+            calibration_data=calibration_data,
+            max_batch=batch_size,
+            engine_dir=engine_dir,
+        )
+        try:
+            self.detector.warmup(batch_size=batch_size)
+        except Exception as e:
+            print(f"Error warming up detector: {e}")
+        # The model isn't thread-safe, so detections from all clients share one worker
+        self._detect_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="detect")
+        # pyzbar calls into libzbar through ctypes, which drops the GIL, so threads are enough
+        self._zbar_executor = ThreadPoolExecutor(
+            max_workers=min(4, os.cpu_count() or 1), thread_name_prefix="zbar"
+        )
+        # Image decoding releases the GIL, so uploads from several clients decode in parallel
+        self._decode_executor = ThreadPoolExecutor(
+            max_workers=os.cpu_count(), thread_name_prefix="decode"
+        )
+        if max_inflight is None:
+            # Room for one batch running and the next filling up; on CPU also allow
+            # parallel decodes on up to half the cores, leaving the rest for inference
+            max_inflight = 2 * batch_size
+            if not self.detector.device.startswith("cuda"):
+                max_inflight = max(max_inflight, (os.cpu_count() or 2) // 2)
+        self._inflight = asyncio.Semaphore(max_inflight)
+        self._batch_queue: asyncio.Queue[tuple[np.ndarray, asyncio.Future]] | None = None
+        self._batch_task: asyncio.Task | None = None
+
+    def detect(self, image: np.ndarray, tracker: QRTracker | None = None) -> list[QRCode]:
+        if tracker is not None:
+            tracked = tracker.track(image)
+            if tracked is not None:
+                return tracked
 
-    def detect(self, image: np.ndarray) -> list[QRCode]:
         detections = self.detector.detect(image=image, is_bgr=True)
-        if not detections:
-            return []
-
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-
-        qr_codes = []
-        for detection in detections:
-            x1, y1, x2, y2 = detection["bbox_xyxy"]  # type: ignore
-            x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-
-            # Decode QR content from the cropped region using pyzbar
-            pad = 10
-            h, w = gray.shape
-            crop = gray[max(0, y1 - pad) : min(h, y2 + pad), max(0, x1 - pad) : min(w, x2 + pad)]
-            decoded = None
-            results = pyzbar_decode(crop)
-            if results:
-                decoded = results[0].data.decode("utf-8", errors="replace")
-
-            qr_codes.append(
-                QRCode(
-                    data=detection.get("data", ""),  # type: ignore
-                    bbox=(x1, y1, x2, y2),
-                    confidence=detection.get("confidence", 1.0),  # type: ignore
-                    decoded=decoded,
-                )
+        return self._to_qr_codes(image, detections, tracker)
+
+    def _to_qr_codes(
+        self, image: np.ndarray, detections: list[dict], tracker: QRTracker | None
+    ) -> list[QRCode]:
+        # Cast all boxes to Python ints in one pass rather than int() per coordinate
+        xyxy = np.array([d["bbox_xyxy"] for d in detections], dtype=np.float32).reshape(-1, 4)
+        bboxes = [tuple(bbox) for bbox in xyxy.astype(np.int32).tolist()]
+
+        decodable = []
+        for detection, bbox in zip(detections, bboxes):
+            # zbar can't resolve modules in tiny boxes, and low-confidence boxes are mostly junk
+            if (
+                detection.get("confidence", 1.0) >= self.decode_conf_threshold  # type: ignore
+                and min(bbox[2] - bbox[0], bbox[3] - bbox[1]) >= self.min_decode_size
+            ):
+                decodable.append(bbox)
+
+        # Decode QR content from the cropped regions using pyzbar, one crop per thread;
+        # only the crops are converted to grayscale, not the whole image
+        if len(decodable) > 1:
+            found = self._zbar_executor.map(lambda bbox: decode_region(image, bbox, pad=10), decodable)
+        else:
+            found = [decode_region(image, bbox, pad=10) for bbox in decodable]
+        decoded = {bbox: result[0] for bbox, result in zip(decodable, found) if result is not None}
+
+        qr_codes = [
+            QRCode(
+                data=detection.get("data", ""),  # type: ignore
+                bbox=bbox,
+                confidence=detection.get("confidence", 1.0),  # type: ignore
+                decoded=decoded.get(bbox),
             )
+            for detection, bbox in zip(detections, bboxes)
+        ]
+
+        if tracker is not None:
+            # The tracker re-decodes every code it follows and gives up on the first miss,
+            # so it only helps when pyzbar read them all; otherwise detect again next frame
+            # rather than re-running pyzbar on boxes that are gated out or undecodable
+            tracker.reset(qr_codes if all(qr.decoded is not None for qr in qr_codes) else [])
         return qr_codes
 
+    async def _detect_async(
+        self, image: np.ndarray, tracker: QRTracker
+    ) -> tuple[list[QRCode], float]:
+        """Track or detect QR codes in image, returning them and the time spent processing.
+
+        Only the steps themselves are timed, not waiting for a batch or for other clients.
+        """
+        start = time.perf_counter()
+        tracked = await asyncio.to_thread(tracker.track, image)
+        if tracked is not None:
+            return tracked, time.perf_counter() - start
+        elapsed = time.perf_counter() - start
+
+        detections, inference_time = await self._submit(image)
+
+        start = time.perf_counter()
+        qr_codes = await asyncio.to_thread(self._to_qr_codes, image, detections, tracker)
+        return qr_codes, elapsed + inference_time + time.perf_counter() - start
+
+    async def _submit(self, image: np.ndarray) -> tuple[list[dict], float]:
+        """Queue image for the next batched forward pass and wait for its detections."""
+        if self._batch_task is None or self._batch_task.done():
+            self._batch_queue = asyncio.Queue()
+            self._batch_task = asyncio.create_task(self._batch_worker())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._batch_queue.put((image, future))  # type: ignore
+        return await future
+
+    async def _batch_worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        queue = self._batch_queue
+        while True:
+            # Take up to batch_size requests, waiting at most max_delay_ms after the first
+            items = [await queue.get()]  # type: ignore
+            deadline = loop.time() + self.max_delay_ms / 1000
+            while len(items) < self.batch_size:
+                try:
+                    items.append(queue.get_nowait())  # type: ignore
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(await asyncio.wait_for(queue.get(), remaining))  # type: ignore
+                except TimeoutError:
+                    break
+
+            try:
+                results, inference_time = await loop.run_in_executor(
+                    self._detect_executor, self._detect_batch_timed, [image for image, _ in items]
+                )
+            except Exception as e:
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), detections in zip(items, results):
+                # The client may have disconnected while waiting
+                if not future.done():
+                    future.set_result((detections, inference_time))
+
+    def _detect_batch_timed(self, images: list[np.ndarray]) -> tuple[list[list[dict]], float]:
+        start = time.perf_counter()
+        results = self.detector.detect_batch(images, is_bgr=True)
+        return results, time.perf_counter() - start
+
     def decode_image(self, raw: bytes) -> np.ndarray:
+        """Decode JPEG (by magic bytes) with libjpeg-turbo if available, anything else with OpenCV."""
+        if self._tj is not None and raw[:2] == b"\xff\xd8":
+            # JPEG: libturbojpeg can scale during the IDCT, which is cheaper than resizing after
+            scaling_factor = (1, self.decode_scale) if self.decode_scale != 1 else None
+            try:
+                if self._tj_dst:
+                    # libjpeg-turbo rounds scaled dimensions up
+                    width, height, _, _ = self._tj.decode_header(raw)
+                    scale = self.decode_scale
+                    dst = self._frame_pool.acquire((-(-height // scale), -(-width // scale), 3))
+                    return self._tj.decode(
+                        raw, pixel_format=TJPF_BGR, scaling_factor=scaling_factor, dst=dst
+                    )
+                return self._tj.decode(raw, pixel_format=TJPF_BGR, scaling_factor=scaling_factor)
+            except OSError:
+                raise ValueError("Failed to decode image")
+
         buf = np.frombuffer(raw, dtype=np.uint8)
-        image = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+        flags = cv2.IMREAD_REDUCED_COLOR_2 if self.decode_scale == 2 else cv2.IMREAD_COLOR
+        image = cv2.imdecode(buf, flags)
         if image is None:
             raise ValueError("Failed to decode image")
         return image
 
+    async def _send_json(self, websocket, obj: dict) -> None:  # type: ignore
+        # orjson produces UTF-8 bytes; send them as a text frame without a decode round-trip
+        await websocket.send(orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY), text=True)
+
+    async def _send_msgpack(self, websocket, obj: dict) -> None:  # type: ignore
+        # Binary frames: smaller than JSON and the client skips UTF-8 validation
+        await websocket.send(msgpack.packb(obj, use_bin_type=True, default=_numpy_item))
+
+    async def _send_error(self, websocket, fmt: str, message: str) -> None:  # type: ignore
+        frame = _ERROR_FRAMES[fmt].get(message)
+        if frame is None:
+            error = {"error": message}
+            frame = orjson.dumps(error) if fmt == "json" else msgpack.packb(error, use_bin_type=True)
+        await websocket.send(frame, text=fmt == "json")
+
+    async def _decode_message(self, message: bytes | str) -> np.ndarray:
+        # Decoding runs off the event loop so other clients stay responsive
+        loop = asyncio.get_running_loop()
+        if isinstance(message, bytes):
+            return await loop.run_in_executor(self._decode_executor, self.decode_image, message)
+        if isinstance(message, str):
+            image_b64 = orjson.loads(message).get("image")
+            if image_b64 is None:
+                raise ValueError("Missing 'image' field")
+            # SIMD base64; clients that can should send raw bytes and skip this entirely
+            return await loop.run_in_executor(
+                self._decode_executor,
+                self.decode_image,
+                pybase64.b64decode(image_b64, validate=False),
+            )
+        raise ValueError("Unsupported message type")
+
     async def handle(self, websocket) -> None:  # type: ignore
+        # Responses are JSON text frames unless the client connects with ?format=msgpack
+        fmt = parse_qs(urlsplit(websocket.request.path).query).get("format", ["json"])[0]
+        if fmt not in ("json", "msgpack"):
+            await self._send_error(websocket, "json", f"Unsupported format: {fmt}")
+            return
+        send = self._send_msgpack if fmt == "msgpack" else self._send_json
+
+        # Consecutive frames on one connection usually show the same codes
+        tracker = QRTracker(redetect_interval=self.redetect_interval)
         async for message in websocket:
             try:
-                if isinstance(message, bytes):
-                    image = self.decode_image(message)
-                elif isinstance(message, str):
-                    payload = json.loads(message)
-                    image_b64 = payload.get("image")
-                    if image_b64 is None:
-                        await websocket.send(
-                            json.dumps({"error": "Missing 'image' field"})
-                        )
-                        continue
-                    image = self.decode_image(base64.b64decode(image_b64))
-                else:
-                    await websocket.send(
-                        json.dumps({"error": "Unsupported message type"})
-                    )
-                    continue
+                # Cap the frames being decoded or waiting on the model across all clients,
+                # so a burst of uploads can't pile up decoded images in memory
+                async with self._inflight:
+                    image = await self._decode_message(message)
+                    qr_codes, processing_time = await self._detect_async(image, tracker)
 
-                start = time.perf_counter()
-                qr_codes = self.detect(image)
-                processing_time = time.perf_counter() - start
+                # Report boxes in the coordinates of the uploaded image
+                if self.decode_scale != 1:
+                    qr_codes = [
+                        replace(qr, bbox=tuple(c * self.decode_scale for c in qr.bbox))  # type: ignore
+                        if qr.bbox is not None
+                        else qr
+                        for qr in qr_codes
+                    ]
 
                 response = {
-                    "detections": [asdict(qr) for qr in qr_codes],
+                    "detections": [
+                        {
+                            "data": qr.data,
+                            "bbox": qr.bbox,
+                            "confidence": qr.confidence,
+                            "decoded": qr.decoded,
+                        }
+                        for qr in qr_codes
+                    ],
                     "count": len(qr_codes),
                     "processing_time": round(processing_time, 4),
                 }
-                await websocket.send(json.dumps(response))
+                await send(websocket, response)
+                # Nothing refers to the frame once the response is out
+                self._frame_pool.release(image)
 
-            except json.JSONDecodeError:
-                await websocket.send(json.dumps({"error": "Invalid JSON"}))
+            except orjson.JSONDecodeError:
+                await self._send_error(websocket, fmt, "Invalid JSON")
             except ValueError as e:
-                await websocket.send(json.dumps({"error": str(e)}))
+                await self._send_error(websocket, fmt, str(e))
             except Exception as e:
-                await websocket.send(json.dumps({"error": f"Processing error: {e}"}))
+                await self._send_error(websocket, fmt, f"Processing error: {e}")
 
     async def run(self) -> None:
         loop = asyncio.get_running_loop()
@@ -116,7 +430,10 @@ class DetectionServer:
                 # Windows doesn't support add_signal_handler
                 pass
 
-        async with serve(self.handle, self.host, self.port, max_size=self.max_size) as server:
+        # Uploads are already compressed images, so permessage-deflate would only burn CPU
+        async with serve(
+            self.handle, self.host, self.port, max_size=self.max_size, compression=None
+        ) as server:
             print(f"Detection server listening on ws://{self.host}:{self.port}")
             try:
                 await stop
@@ -124,8 +441,21 @@ class DetectionServer:
                 # Fallback for Windows: just run forever
                 await asyncio.Future()
 
+        await self.close()
         print("Server stopped.")
 
+    async def close(self) -> None:
+        """Stop the batch worker and the worker threads; call once no connections are left."""
+        if self._batch_task is not None:
+            self._batch_task.cancel()
+            try:
+                await self._batch_task
+            except asyncio.CancelledError:
+                pass
+            self._batch_task = None
+        for executor in (self._detect_executor, self._zbar_executor, self._decode_executor):
+            executor.shutdown(wait=False, cancel_futures=True)
+
 
 def main() -> None:
     import argparse
@@ -139,12 +469,76 @@ def main() -> None:
         choices=["n", "s", "m", "l"],
         help="YOLO model size for QR detection",
     )
+    parser.add_argument(
+        "--num-threads",
+        type=int,
+        default=None,
+        help="Number of torch intra-op threads (default: torch's choice)",
+    )
+    parser.add_argument(
+        "--decode-scale",
+        type=int,
+        default=1,
+        choices=[1, 2],
+        help="Decode uploaded images at 1/N resolution before detection",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1,
+        help="Maximum number of images from concurrent requests per forward pass",
+    )
+    parser.add_argument(
+        "--max-delay-ms",
+        type=float,
+        default=5.0,
+        help="How long a request waits for others to fill its batch",
+    )
+    parser.add_argument(
+        "--max-inflight",
+        type=int,
+        default=None,
+        help="Maximum uploads being decoded or detected at once (default: depends on device)",
+    )
+    parser.add_argument(
+        "--cpu-affinity",
+        type=lambda value: [int(cpu) for cpu in value.split(",")],
+        default=None,
+        help="Comma-separated CPU cores to pin the server to, e.g. 0,1,2,3 (Linux only)",
+    )
+    parser.add_argument(
+        "--quantize",
+        action="store_true",
+        help="Run the detector as an INT8 TensorRT engine (CUDA only), exported on first use",
+    )
+    parser.add_argument(
+        "--calibration-data",
+        default=None,
+        help="Dataset YAML used to calibrate the INT8 engine",
+    )
+    parser.add_argument(
+        "--engine-dir",
+        default=None,
+        help="Where exported INT8 engines are cached (default: ~/.cache/qr_to_pos)",
+    )
     args = parser.parse_args()
 
     server = DetectionServer(
-        host=args.host, port=args.port, model_size=args.model_size
+        host=args.host,
+        port=args.port,
+        model_size=args.model_size,
+        num_threads=args.num_threads,
+        decode_scale=args.decode_scale,
+        batch_size=args.batch_size,
+        max_delay_ms=args.max_delay_ms,
+        max_inflight=args.max_inflight,
+        cpu_affinity=args.cpu_affinity,
+        quantize=args.quantize,
+        calibration_data=args.calibration_data,
+        engine_dir=args.engine_dir,
     )
-    asyncio.run(server.run())
+    # libuv-based loop when installed; same behaviour, faster socket handling
+    asyncio.run(server.run(), loop_factory=uvloop.new_event_loop if uvloop is not None else None)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,62 @@
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+import pytest
+
+from qr_to_pos.camera import Frame
+from qr_to_pos.processor import QRCodeProcessor
+
+
+def qr_frame(text: str, index: int, origin: int = 100) -> tuple[Frame, tuple[int, int, int, int]]:
+    """A camera frame with a single QR code encoding text, and the code's bounding box."""
+    code = cv2.QRCodeEncoder.create().encode(text)
+    code = cv2.resize(code, None, fx=8, fy=8, interpolation=cv2.INTER_NEAREST)
+    image = np.full((480, 640, 3), 255, dtype=np.uint8)
+    h, w = code.shape
+    image[origin : origin + h, origin : origin + w] = code[:, :, None]
+    return Frame(data=image, index=index, timestamp=float(index)), (origin, origin, origin + w, origin + h)
+
+
+@pytest.fixture(scope="module")
+def processor():
+    # Only the frame size is read from the camera outside the processing loop
+    return QRCodeProcessor(SimpleNamespace(height=480, width=640), static_threshold=0)
+
+
+def test_tracker_skips_detection_on_repeated_frame(processor, monkeypatch):
+    frame, bbox = qr_frame("tracked", index=0)
+    calls = []
+
+    def detect_batch(images, is_bgr=False):
+        calls.append(len(images))
+        return [[{"bbox_xyxy": np.array(bbox, dtype=np.float32), "confidence": 0.9}] for _ in images]
+
+    monkeypatch.setattr(processor.detector, "detect_batch", detect_batch)
+    processor._tracker.reset([])
+
+    for _ in range(2):
+        [result] = processor.process_frames([frame])
+        assert [qr.decoded for qr in result] == ["tracked"]
+
+    # The second frame is answered by the tracker alone
+    assert calls == [1]
+
+
+def test_tracker_ignores_undecodable_boxes(processor, monkeypatch):
+    frame = Frame(data=np.full((480, 640, 3), 255, dtype=np.uint8), index=0, timestamp=0.0)
+    calls = []
+
+    def detect_batch(images, is_bgr=False):
+        calls.append(len(images))
+        return [[{"bbox_xyxy": np.array([100, 100, 200, 200], dtype=np.float32), "confidence": 0.9}]]
+
+    monkeypatch.setattr(processor.detector, "detect_batch", detect_batch)
+    processor._tracker.reset([])
+
+    for _ in range(2):
+        [result] = processor.process_frames([frame])
+        assert len(result) == 1
+
+    # Nothing to follow in a blank frame, so both frames go to the detector
+    assert calls == [1, 1]
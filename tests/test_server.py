@@ -1,33 +1,113 @@
+import asyncio
 import json
+import mmap
 from pathlib import Path
 
+import cv2
+import msgpack
+import numpy as np
 import pytest
+import pytest_asyncio
 import websockets
 from websockets.asyncio.server import serve
 
-from qr_to_pos.server import DetectionServer
+import qr_to_pos.server
+from qr_to_pos.server import DetectionServer, FramePool
 
 IMAGE_PATH = Path(__file__).resolve().parent.parent / "qrs.png"
 
 
-@pytest.fixture()
-async def server_url():
-    server = DetectionServer(host="localhost", port=0, model_size="s")
-    async with serve(server.handle, server.host, 0, max_size=server.max_size) as ws_server:
+@pytest.fixture(scope="session")
+def event_loop_policy():
+    # Run against the same loop implementation the server uses in production
+    try:
+        import uvloop
+    except ImportError:
+        return asyncio.DefaultEventLoopPolicy()
+    return uvloop.EventLoopPolicy()
+
+
+@pytest.fixture(scope="session")
+def image_bytes():
+    # Map the file once and hand out a view; ws.send takes any bytes-like object
+    with open(IMAGE_PATH, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        view = memoryview(mm)
+        yield view
+        view.release()
+
+
+@pytest.fixture(scope="session")
+def jpeg_bytes(image_bytes):
+    # Re-encode as JPEG to exercise the libjpeg-turbo decode path
+    image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    ok, buf = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 95])
+    assert ok
+    return buf.tobytes()
+
+
+def qr_image(text: str, origin: int = 100) -> tuple[np.ndarray, tuple[int, int, int, int]]:
+    """A BGR frame with a single QR code encoding text, and the code's bounding box."""
+    code = cv2.QRCodeEncoder.create().encode(text)
+    code = cv2.resize(code, None, fx=8, fy=8, interpolation=cv2.INTER_NEAREST)
+    image = np.full((480, 640, 3), 255, dtype=np.uint8)
+    h, w = code.shape
+    image[origin : origin + h, origin : origin + w] = code[:, :, None]
+    return image, (origin, origin, origin + w, origin + h)
+
+
+def encode_png(image: np.ndarray) -> bytes:
+    ok, buf = cv2.imencode(".png", image)
+    assert ok
+    return buf.tobytes()
+
+
+# One server (and one model load) for the whole run; tests share its event loop
+@pytest.fixture(scope="session")
+def server():
+    return DetectionServer(host="localhost", port=0, model_size="s")
+
+
+@pytest_asyncio.fixture(scope="session", loop_scope="session")
+async def server_url(server):
+    async with serve(
+        server.handle, server.host, 0, max_size=server.max_size, compression=None
+    ) as ws_server:
         # Get the actual port assigned by the OS
         port = ws_server.sockets[0].getsockname()[1]
         yield f"ws://localhost:{port}"
+    await server.close()
 
 
-@pytest.mark.asyncio
-async def test_detect_qrs_from_image(server_url):
-    image_bytes = IMAGE_PATH.read_bytes()
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.parametrize("fmt", ["png", "jpeg"])
+async def test_detect_qrs_from_image(server, server_url, image_bytes, jpeg_bytes, fmt, monkeypatch):
+    decoders = []
+    if fmt == "jpeg":
+        if server._tj is None:
+            pytest.skip("PyTurboJPEG / libturbojpeg not installed")
+        tj_decode = server._tj.decode
+
+        def spy_tj_decode(*args, **kwargs):
+            decoders.append("turbojpeg")
+            return tj_decode(*args, **kwargs)
+
+        monkeypatch.setattr(server._tj, "decode", spy_tj_decode)
+
+    imdecode = cv2.imdecode
+
+    def spy_imdecode(*args):
+        decoders.append("opencv")
+        return imdecode(*args)
+
+    monkeypatch.setattr(cv2, "imdecode", spy_imdecode)
+    payload = image_bytes if fmt == "png" else jpeg_bytes
 
     async with websockets.connect(server_url) as ws:
-        await ws.send(image_bytes)
+        await ws.send(payload)
         raw = await ws.recv()
 
     result = json.loads(raw)
+    assert decoders == ["turbojpeg" if fmt == "jpeg" else "opencv"]
 
     # Should not be an error response
     assert "error" not in result
@@ -51,4 +131,130 @@ async def test_detect_qrs_from_image(server_url):
     decoded_values = [d["decoded"] for d in result["detections"] if d["decoded"]]
     assert len(decoded_values) > 0, "pyzbar should decode at least one QR code"
 
-    print(decoded_values)
\ No newline at end of file
+    print(decoded_values)
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_detect_qrs_streaming(server_url, image_bytes):
+    # Many frames over one connection, as a camera client would send them
+    async with websockets.connect(f"{server_url}/?format=msgpack") as ws:
+        for _ in range(10):
+            await ws.send(image_bytes)
+            raw = await ws.recv()
+            assert isinstance(raw, bytes)
+            result = msgpack.unpackb(raw, raw=False)
+
+            assert "error" not in result
+            assert result["count"] > 0
+            assert len(result["detections"]) == result["count"]
+            assert isinstance(result["processing_time"], float)
+            assert all(len(d["bbox"]) == 4 for d in result["detections"])
+            assert any(d["decoded"] for d in result["detections"])
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_tracker_skips_detection_on_repeated_frame(server, server_url, monkeypatch):
+    image, bbox = qr_image("tracked")
+    calls = []
+
+    def detect_batch(images, is_bgr=False):
+        calls.append(len(images))
+        return [[{"bbox_xyxy": np.array(bbox, dtype=np.float32), "confidence": 0.9}] for _ in images]
+
+    monkeypatch.setattr(server.detector, "detect_batch", detect_batch)
+
+    async with websockets.connect(server_url) as ws:
+        for _ in range(2):
+            await ws.send(encode_png(image))
+            result = json.loads(await ws.recv())
+            assert [d["decoded"] for d in result["detections"]] == ["tracked"]
+
+    # The second frame is answered by the tracker alone
+    assert calls == [1]
+
+
+def test_tiny_boxes_skip_pyzbar(server, monkeypatch):
+    image, _ = qr_image("tiny")
+    calls = []
+
+    def decode_region(*args, **kwargs):
+        calls.append(args)
+        return None
+
+    monkeypatch.setattr(qr_to_pos.server, "decode_region", decode_region)
+
+    size = server.min_decode_size - 4
+    bbox = np.array([10, 10, 10 + size, 10 + size], dtype=np.float32)
+    qr_codes = server._to_qr_codes(image, [{"bbox_xyxy": bbox, "confidence": 0.9}], None)
+
+    assert [qr.decoded for qr in qr_codes] == [None]
+    assert calls == []
+
+
+def test_frame_pool_reuses_released_buffers():
+    pool = FramePool(max_buffers=1)
+    first = pool.acquire((48, 64, 3))
+    second = pool.acquire((48, 64, 3))
+    pool.release(first)
+    # Over the cap, so this one is dropped rather than pooled
+    pool.release(second)
+
+    assert pool.acquire((48, 64, 3)) is first
+    assert pool.acquire((48, 64, 3)) is not second
+
+
+def test_frame_pool_ignores_foreign_buffers():
+    pool = FramePool(max_buffers=2)
+    foreign = np.empty((48, 64, 3), dtype=np.uint8)
+    pool.release(foreign)
+
+    buf = pool.acquire((48, 64, 3))
+    assert buf is not foreign
+    # A buffer is only taken back once per acquire
+    pool.release(buf)
+    pool.release(buf)
+    assert pool.acquire((48, 64, 3)) is buf
+    assert pool.acquire((48, 64, 3)) is not buf
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_micro_batching_across_connections(server, server_url, monkeypatch):
+    monkeypatch.setattr(server, "batch_size", 4)
+    monkeypatch.setattr(server, "max_delay_ms", 200)
+    # Let all four requests reach the batch queue at once
+    monkeypatch.setattr(server, "_inflight", asyncio.Semaphore(8))
+    batch_sizes = []
+
+    def detect_batch(images, is_bgr=False):
+        # One box around the dark pixels of each image, so replies show which image they came from
+        batch_sizes.append(len(images))
+        detections = []
+        for image in images:
+            x, y, w, h = cv2.boundingRect(cv2.inRange(image, (0, 0, 0), (127, 127, 127)))
+            bbox = np.array([x, y, x + w, y + h], dtype=np.float32)
+            detections.append([{"bbox_xyxy": bbox, "confidence": 0.9}])
+        return detections
+
+    monkeypatch.setattr(server.detector, "detect_batch", detect_batch)
+
+    async def request(image):
+        async with websockets.connect(server_url) as ws:
+            await ws.send(encode_png(image))
+            return json.loads(await ws.recv())
+
+    # Concurrent clients share a forward pass and each get their own detections back
+    frames = [qr_image(f"client-{i}", origin=40 + 60 * i) for i in range(4)]
+    results = await asyncio.gather(*(request(image) for image, _ in frames))
+    assert max(batch_sizes) > 1
+    for i, (result, (_, bbox)) in enumerate(zip(results, frames)):
+        assert [d["decoded"] for d in result["detections"]] == [f"client-{i}"]
+        x1, y1, x2, y2 = result["detections"][0]["bbox"]
+        assert bbox[0] <= x1 < x2 <= bbox[2] and bbox[1] <= y1 < y2 <= bbox[3]
+
+    # A lone request doesn't wait for a full batch, only for max_delay_ms
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    result = await asyncio.wait_for(request(qr_image("alone")[0]), timeout=10)
+    assert loop.time() - start >= server.max_delay_ms / 1000
+    assert batch_sizes[-1] == 1
+    assert [d["decoded"] for d in result["detections"]] == ["alone"]